@@ -1,37 +1,149 @@
+import io
 import os.path
 import sqlite3
+import struct
+import zipfile
+import zlib
 import logging
 import itertools
 import operator
 import hashlib
+import functools
 import yaml
 import numpy as np
 
-from .constants import FRAME_MD
+log = logging.getLogger("imgstore.index")
 
+# the frame metadata that is put in the index
+_INDEX_MD = ("frame_number", "frame_time")
+
+# use the libyaml parser if pyyaml was built with it
+_YamlLoader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+
+def _array_from_npy_buffer(buf):
+    """
+    Return the array stored in buf, the contents of a .npy file as uint8.
+    Arrays of plain dtypes are views of buf, so the data is not copied.
+    """
+    version = np.lib.format.read_magic(io.BytesIO(buf[:8].tobytes()))
+    if version == (1, 0):
+        length_format, read_header = "<H", np.lib.format.read_array_header_1_0
+    elif version == (2, 0):
+        length_format, read_header = "<I", np.lib.format.read_array_header_2_0
+    else:
+        return np.lib.format.read_array(io.BytesIO(buf), allow_pickle=True)
+
+    # the magic string and version are followed by the header length
+    length_end = 8 + struct.calcsize(length_format)
+    (header_length,) = struct.unpack(length_format, buf[8:length_end].tobytes())
+    header = io.BytesIO(buf[: length_end + header_length].tobytes())
+    header.seek(8)
+    shape, fortran_order, dtype = read_header(header)
+    if dtype.hasobject:
+        return np.lib.format.read_array(io.BytesIO(buf), allow_pickle=True)
+
+    start = length_end + header_length
+    array = buf[start : start + int(np.prod(shape)) * dtype.itemsize].view(dtype)
+    if fortran_order:
+        return array.reshape(shape[::-1]).transpose()
+    return array.reshape(shape)
+
+
+def _read_npz(path, keys):
+    """
+    Read the arrays stored under keys in the .npz file at path.
+
+    np.savez does not compress, so each member is read from the file in one
+    go (checking its CRC) and its array is decoded in place, rather than
+    copied through the zipfile stream used by np.load. Raises IOError if
+    the file is corrupt.
+    """
+    data = {}
+    try:
+        with open(path, "rb") as f, zipfile.ZipFile(f) as zf:
+            for k in keys:
+                try:
+                    info = zf.getinfo(k + ".npy")
+                except KeyError:
+                    log.info(f"{k} is not available in this dataset")
+                    continue
+
+                if info.compress_type == zipfile.ZIP_STORED:
+                    # skip the local file header, which is followed by
+                    # the file name and the extra field
+                    f.seek(info.header_offset)
+                    header = f.read(30)
+                    if header[:4] != b"PK\x03\x04":
+                        raise zipfile.BadZipFile("bad local file header")
+                    name_length, extra_length = struct.unpack(
+                        "<HH", header[26:30]
+                    )
+                    f.seek(info.header_offset + 30 + name_length + extra_length)
+                    buf = np.empty(info.compress_size, dtype=np.uint8)
+                    if (
+                        f.readinto(buf) != info.compress_size
+                        or zlib.crc32(buf) != info.CRC
+                    ):
+                        raise zipfile.BadZipFile(
+                            "Bad CRC-32 for file %r" % info.filename
+                        )
+                    data[k] = _array_from_npy_buffer(buf)
+                else:
+                    with zf.open(info) as member:
+                        data[k] = np.lib.format.read_array(
+                            member, allow_pickle=True
+                        )
+    except (zipfile.BadZipFile, ValueError, EOFError) as exc:
+        raise IOError("corrupt index %s: %s" % (path, exc))
+
+    return data
+
+
+def _npy_index_path(path_without_extension, key):
+    return "%s_%s.npy" % (path_without_extension, key)
+
+
+def _read_npy(path_without_extension, keys):
+    """
+    Read the per-key .npy index files of a chunk. Numeric arrays are memory
+    mapped rather than read into memory up front
+    """
+    data = {}
+    for k in keys:
+        path = _npy_index_path(path_without_extension, k)
+        if not os.path.exists(path):
+            log.info(f"{k} is not available in this dataset")
+            continue
 
-log = logging.getLogger("imgstore.index")
+        try:
+            try:
+                data[k] = np.load(path, mmap_mode="r")
+            except ValueError:
+                # object arrays can not be memory mapped
+                data[k] = np.load(path, allow_pickle=True)
+        except (ValueError, EOFError) as exc:
+            raise IOError("corrupt index %s: %s" % (path, exc))
+
+    return data
 
 
 def _load_index(path_without_extension):
+    """
+    Load the frame_number and frame_time arrays of a chunk index
+    """
+    if os.path.exists(_npy_index_path(path_without_extension, "frame_number")):
+        return _read_npy(path_without_extension, _INDEX_MD)
+
     for extension in (".npz", ".yaml"):
         path = path_without_extension + extension
         if os.path.exists(path):
             if extension == ".yaml":
                 with open(path, "rt") as f:
-                    dat = yaml.safe_load(f)
-                    return {k: dat[k] for k in FRAME_MD}
+                    dat = yaml.load(f, Loader=_YamlLoader)
+                    return {k: np.asarray(dat[k]) for k in _INDEX_MD if k in dat}
             elif extension == ".npz":
-                with open(path, "rb") as f:
-                    dat = np.load(f, allow_pickle=True)
-                    data = {}
-                    for k in FRAME_MD:
-                        try:
-                            data[k] = dat[k].tolist()
-                        except KeyError:
-                            log.info(f"{k} is not available in this dataset")
-
-                    return data
+                return _read_npz(path, _INDEX_MD)
         else:
             log.warning(f"{path} is missing")
 
@@ -43,6 +155,13 @@ class ImgStoreIndex(object):
 
     VERSION = "1"
 
+    # rows per multi-row INSERT when building the index. with 4 values per row
+    # this stays below the sqlite limit of 999 parameters (before 3.32)
+    INSERT_BATCH_SIZE = 200
+
+    # number of following frame times read along with a frame time
+    FRAME_TIME_PREFETCH = 64
+
     log = log
 
     def __init__(self, db=None, path=None, chunk_n_and_chunk_paths=None):
@@ -94,6 +213,20 @@ class ImgStoreIndex(object):
         self._chunks = tuple(row[0] for row in cur)
         self._chunk_index = None
 
+        # sorted values, rowid, chunk and frame_idx of all frames by query
+        self._sorted_frames = {}
+
+        # the index is read only, so lookups can be cached. the caches wrap
+        # bound methods, so they reference this instance: an index (and its
+        # connection) is only freed by the cyclic garbage collector
+        self._cached_chunk_and_frame_idx = functools.lru_cache(maxsize=4096)(
+            self._query_chunk_and_frame_idx
+        )
+        self._cached_frame_time = functools.lru_cache(maxsize=4096)(
+            self._query_frame_time
+        )
+        self._prefetched_frame_times = {}
+
     @classmethod
     def create_database(cls, conn):
         c = conn.cursor()
@@ -109,93 +242,125 @@ class ImgStoreIndex(object):
             "INSERT into index_information VALUES (?, ?)",
             ("version", cls.VERSION),
         )
-        c.execute("CREATE INDEX chunk_index ON frames (chunk, frame_idx);")
         conn.commit()
 
+    @classmethod
+    def create_indexes(cls, conn):
+        # created after the frames were inserted, which is faster than
+        # updating them on every insert
+        c = conn.cursor()
+        c.execute("CREATE INDEX chunk_index ON frames (chunk, frame_idx);")
+        c.execute("CREATE INDEX idx_fn ON frames (frame_number);")
+        c.execute("CREATE INDEX idx_ft ON frames (frame_time);")
+
     @classmethod
     def new_from_chunks(cls, chunk_n_and_chunk_paths):
         db = sqlite3.connect(":memory:", check_same_thread=False)
+        cls._configure_connection(db)
         cls.create_database(db)
 
-
-
-        frame_count = 0
-        frame_max = -np.inf
-        frame_min = np.inf
-        frame_time_max = -np.inf
-        frame_time_min = np.inf
+        # the in-memory database is rebuilt on every open, so durability
+        # is irrelevant. (journal_mode=WAL is not supported for :memory:
+        # databases, which always keep their rollback journal in memory)
+        db.execute("pragma synchronous = OFF;")
 
         cur = db.cursor()
 
-        for chunk_n, chunk_path in sorted(
-            chunk_n_and_chunk_paths, key=operator.itemgetter(0)
-        ):
-            try:
-                idx = _load_index(chunk_path)
-            except IOError:
-                cls.log.warn("missing index for chunk %s" % chunk_n)
-                continue
-
-            if not idx["frame_number"]:
-                # empty chunk
-                continue
+        # load all chunks in a single transaction
+        with db:
+            for chunk_n, chunk_path in sorted(
+                chunk_n_and_chunk_paths, key=operator.itemgetter(0)
+            ):
+                try:
+                    idx = _load_index(chunk_path)
+                except IOError as exc:
+                    cls.log.warn(
+                        "could not load index for chunk %s: %s" % (chunk_n, exc)
+                    )
+                    continue
+
+                frame_numbers = idx["frame_number"]
+                frame_times = idx["frame_time"]
+
+                if not frame_numbers.size:
+                    # empty chunk
+                    continue
+
+                try:
+                    n = len(frame_numbers)
+                    # build the (chunk, frame_idx, frame_number, frame_time)
+                    # rows column by column
+                    records = zip(
+                        itertools.repeat(chunk_n, n),
+                        range(n),
+                        frame_numbers.tolist(),
+                        frame_times.tolist(),
+                    )
+                except TypeError:
+                    cls.log.error("corrupt chunk", exc_info=True)
+                    continue
 
-            frame_count += len(idx["frame_number"])
-            frame_time_min = min(frame_time_min, np.min(idx["frame_time"]))
-            frame_time_max = max(frame_time_max, np.max(idx["frame_time"]))
-            frame_min = min(frame_min, np.min(idx["frame_number"]))
-            frame_max = max(frame_max, np.max(idx["frame_number"]))
+                cls._insert_frames(cur, records)
+                cur.execute(
+                    "INSERT INTO chunks VALUES (?, ?)", (chunk_n, chunk_path)
+                )
 
-            try:
-                records = [
-                    (chunk_n, i, fn, ft)
-                    for i, (fn, ft) in enumerate(
-                        zip(idx["frame_number"], idx["frame_time"])
-                    )
-                ]
-            except TypeError:
-                cls.log.error("corrupt chunk", exc_info=True)
-                continue
+            cls.create_indexes(db)
 
-            cur.executemany("INSERT INTO frames VALUES (?,?,?,?)", records)
+            # one aggregate per subquery, so each is answered from the index
+            # on its column rather than by scanning the table
             cur.execute(
-                "INSERT INTO chunks VALUES (?, ?)", (chunk_n, chunk_path)
+                "SELECT (SELECT MIN(frame_time) FROM frames),"
+                " (SELECT MAX(frame_time) FROM frames),"
+                " (SELECT MIN(frame_number) FROM frames),"
+                " (SELECT MAX(frame_number) FROM frames);"
             )
-
-            db.commit()
-
-        cur.execute(
-            "INSERT INTO summary VALUES (?,?)",
-            ("frame_time_min", float(frame_time_min)),
-        )
-        cur.execute(
-            "INSERT INTO summary VALUES (?,?)",
-            ("frame_time_max", float(frame_time_max)),
-        )
-        cur.execute(
-            "INSERT INTO summary VALUES (?,?)", ("frame_min", float(frame_min))
-        )
-        cur.execute(
-            "INSERT INTO summary VALUES (?,?)", ("frame_max", float(frame_max))
-        )
-
-        db.commit()
+            summary = zip(
+                ("frame_time_min", "frame_time_max", "frame_min", "frame_max"),
+                cur.fetchone(),
+            )
+            cur.executemany("INSERT INTO summary VALUES (?,?)", summary)
 
         path = os.path.dirname(chunk_n_and_chunk_paths[0][1])
         return cls(db=db, path=path, chunk_n_and_chunk_paths=chunk_n_and_chunk_paths)
 
+    @classmethod
+    def _insert_frames(cls, cur, records):
+        # insert INSERT_BATCH_SIZE rows per statement, which saves most of the
+        # per row statement overhead of executemany
+        records = iter(records)
+        while True:
+            batch = list(itertools.islice(records, cls.INSERT_BATCH_SIZE))
+            if not batch:
+                break
+            cur.execute(
+                "INSERT INTO frames VALUES " + ",".join(["(?,?,?,?)"] * len(batch)),
+                list(itertools.chain.from_iterable(batch)),
+            )
+
     @classmethod
     def new_from_file(cls, path):
         db = sqlite3.connect(path, check_same_thread=False)
+        cls._configure_connection(db)
+        # read the database file through a memory map (up to 256MB)
+        db.execute("pragma mmap_size = 268435456;")
         return cls(db, path=path, chunk_n_and_chunk_paths=None)
 
+    @staticmethod
+    def _configure_connection(db):
+        # a 64MB page cache (the default is 2MB), and temporary tables and
+        # indices (e.g. for GROUP BY and ORDER BY) in memory
+        db.execute("pragma cache_size = -65536;")
+        db.execute("pragma temp_store = MEMORY;")
+
     @staticmethod
     def _get_metadata(cur, var_names):
-        md = {v: [] for v in var_names}
-        for row in cur:
-            for i, v in enumerate(var_names):
-                md[v].append(row[i])
-        return md
+        rows = cur.fetchall()
+        if not rows:
+            return {v: [] for v in var_names}
+        # transpose the rows into columns
+        cols = zip(*rows)
+        return {v: list(col) for v, col in zip(var_names, cols)}
 
     @property
     def chunks(self):
@@ -203,14 +368,34 @@ class ImgStoreIndex(object):
         return self._chunks
 
     def to_file(self, path):
-        db = sqlite3.connect(path)
-        with db:
-            for line in self._conn.iterdump():
-                # let python handle the transactions
-                if line not in ("BEGIN;", "COMMIT;"):
-                    db.execute(line)
-        db.commit()
-        db.close()
+        for _, name, filename in self._conn.execute("pragma database_list;"):
+            if (
+                name == "main"
+                and filename
+                and os.path.exists(path)
+                and os.path.samefile(filename, path)
+            ):
+                # the index is read only, so the file already holds it
+                self.log.debug("index already saved to %s" % path)
+                return
+
+        # copy the database pages into a new file, rather than replaying it
+        # as sql, and then replace path with it. backing up into path itself
+        # would wait forever for other connections to it to close
+        tmp_path = "%s.%d.tmp" % (path, os.getpid())
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        try:
+            db = sqlite3.connect(tmp_path)
+            try:
+                self._conn.backup(db)
+            finally:
+                db.close()
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
 
     def get_all_metadata(self, rowid=None):
         cur = self._conn.cursor()
@@ -249,62 +434,102 @@ class ImgStoreIndex(object):
         return self._get_metadata(cur, ["frame_number", "frame_time"])
 
     def get_frame_time(self, frame_number=None, frame_idx=None):
-        cur = self._conn.cursor()
         if frame_number is None and not frame_idx is None:
-            cur.execute(
-                "SELECT frame_time FROM frames WHERE frame_idx = ? ORDER BY rowid;",
-                (frame_idx,),
-            )
+            return self._cached_frame_time("frame_idx", frame_idx)
         elif not frame_number is None and frame_idx is None:
+            return self._cached_frame_time("frame_number", frame_number)
+        raise ValueError("either frame_number or frame_idx must be given")
+
+    def _query_frame_time(self, metavar, value):
+        cur = self._conn.cursor()
+        if metavar == "frame_idx":
             cur.execute(
-                "SELECT frame_time FROM frames WHERE frame_number = ? ORDER BY rowid;",
-                (frame_number,),
+                "SELECT frame_time FROM frames WHERE frame_idx = ? ORDER BY rowid LIMIT 1;",
+                (value,),
             )
-        return self._get_metadata(cur, ["frame_time"])["frame_time"][0]
+            row = cur.fetchone()
+            if row is None:
+                raise IndexError("frame_idx %s not found in index" % value)
+            return row[0]
+
+        try:
+            return self._prefetched_frame_times.pop(value)
+        except KeyError:
+            pass
+
+        # during playback the next frames are asked for next, so read them too
+        cur.execute(
+            "SELECT frame_number, frame_time FROM frames"
+            " WHERE frame_number >= ? AND frame_number <= ? ORDER BY rowid;",
+            (value, value + self.FRAME_TIME_PREFETCH),
+        )
+        frame_times = {}
+        for fn, ft in cur:
+            frame_times.setdefault(fn, ft)
+        if value not in frame_times:
+            raise IndexError("frame_number %s not found in index" % value)
+        frame_time = frame_times.pop(value)
+        self._prefetched_frame_times = frame_times
+        return frame_time
 
     def get_chunk_interval(self, chunk_n, metavar="frame_time"):
         """
-        Given a chunk number, return the first and last value of the metavar for that chunk
+        Given a chunk number, return the smallest and largest value of the metavar for that chunk
         By default metavar is frame_time, which consists of the time in ms at which each frame was taken
         """
+        assert metavar in ("frame_number", "frame_time")
         cur = self._conn.cursor()
-        # from https://stackoverflow.com/a/12133952/3541756
-        row_number = "row_number() over (order by frame_number desc) as rn"
-        row_count = f"count(*) over () as total_count FROM frames WHERE chunk={chunk_n}"
         cur.execute(
-            f"SELECT {metavar} from (SELECT {metavar}, {row_number}, {row_count}) where rn=1 or rn=total_count ORDER BY rn DESC;"
+            f"SELECT MIN({metavar}), MAX({metavar}) FROM frames WHERE chunk = ?;",
+            (chunk_n,),
         )
-
-        data = []
-        for d in cur:
-            data.append(d[0])
-        if data:
-            start, end = data
-            return start, end
-        else:
+        start, end = cur.fetchone()
+        if start is None:
             return None
+        return start, end
 
     @property
     def chunk_index(self):
 
-        cache_dir = os.path.join(self._path, "cache")
-        os.makedirs(cache_dir, exist_ok=True)
-        data = sorted(self._chunk_n_and_chunk_paths, key=lambda x: x[0])
-        hashable = "".join([str(e) for e in list(itertools.chain(*data))])
-        hash_res = hashlib.md5(hashable.encode()).hexdigest()
-        cached_index = os.path.join(cache_dir, f"chunk_index_{hash_res}.npy")
-        print(cached_index)
-
         if self._chunk_index is None:
 
+            cache_dir = os.path.join(self._path, "cache")
+            os.makedirs(cache_dir, exist_ok=True)
+            md5 = hashlib.md5()
+            for chunk_n, chunk_path in sorted(self._chunk_n_and_chunk_paths, key=operator.itemgetter(0)):
+                md5.update(f"{chunk_n}|{chunk_path}\n".encode())
+            cached_index = os.path.join(cache_dir, f"chunk_index_{md5.hexdigest()}.npz")
+
             if os.path.exists(cached_index):
-                self._chunk_index = np.load(cached_index, allow_pickle=True).item()
+                with np.load(cached_index, allow_pickle=False) as dat:
+                    chunks = dat["chunks"].tolist()
+                    frame_number = dat["frame_number"].tolist()
+                    frame_time = dat["frame_time"].tolist()
             else:
-                self._chunk_index = {
-                    "frame_number": {chunk: self.get_chunk_interval(chunk, "frame_number") for chunk in self._chunks},
-                    "frame_time": {chunk: self.get_chunk_interval(chunk, "frame_time") for chunk in self._chunks}
-                }
-                np.save(cached_index, self._chunk_index)
+                cur = self._conn.cursor()
+                cur.execute(
+                    "SELECT chunk, MIN(frame_number), MAX(frame_number), MIN(frame_time), MAX(frame_time)"
+                    " FROM frames GROUP BY chunk ORDER BY chunk;"
+                )
+                chunks, frame_number, frame_time = [], [], []
+                for chunk, fn_min, fn_max, ft_min, ft_max in cur:
+                    chunks.append(chunk)
+                    frame_number.append((fn_min, fn_max))
+                    frame_time.append((ft_min, ft_max))
+                # plain arrays, so that loading them does not need pickle
+                np.savez(
+                    cached_index,
+                    chunks=np.array(chunks, dtype=np.int64),
+                    frame_number=np.array(
+                        frame_number, dtype=self._get_column_dtype("frame_number")
+                    ).reshape(-1, 2),
+                    frame_time=np.array(frame_time, dtype=np.float64).reshape(-1, 2),
+                )
+
+            self._chunk_index = {
+                "frame_number": {chunk: tuple(v) for chunk, v in zip(chunks, frame_number)},
+                "frame_time": {chunk: tuple(v) for chunk, v in zip(chunks, frame_time)},
+            }
 
         return self._chunk_index
 
@@ -325,19 +550,66 @@ class ImgStoreIndex(object):
         and the index of the frame inside the chunk
         (where the first frame of the chunk has index 0)
         """
+        assert metavar in ("frame_number", "frame_time")
+        return self._cached_chunk_and_frame_idx(value, metavar)
+
+    def _query_chunk_and_frame_idx(self, value, metavar):
+        values, _, chunks, frame_idxs = self._get_sorted_frames(metavar)
+        i = np.searchsorted(values, value, side="left")
+        if i < len(values) and values[i] == value:
+            return int(chunks[i]), int(frame_idxs[i])
+        return None
+
+    def _get_column_dtype(self, column):
+        """
+        Return the dtype that holds the values of column (frame_number or frame_time)
+        without loss: frame numbers are integers, unless a chunk stored them as floats
+        """
+        if column == "frame_time":
+            return np.float64
+
         cur = self._conn.cursor()
         cur.execute(
-            f"SELECT chunk, frame_idx FROM frames where {metavar} = {value}"
+            f"SELECT EXISTS (SELECT 1 FROM frames"
+            f" WHERE typeof({column}) NOT IN ('integer', 'null'));"
         )
-        data = []
-        for d in cur:
-            data.extend(d)
-        if data:
-            chunk, frame_idx = data
-            return chunk, frame_idx
-        else:
-            return None
+        (non_integer,) = cur.fetchone()
+        return np.float64 if non_integer else np.int64
 
+    def _get_sorted_frames(self, query):
+        """
+        Return the (non NULL) values of query in ascending order, and the rowid, chunk
+        and frame_idx of the corresponding frames. Frames with equal values are in rowid order.
+        The arrays are built on first use and answer lookups with np.searchsorted.
+        """
+        try:
+            return self._sorted_frames[query]
+        except KeyError:
+            pass
+
+        value_dtype = self._get_column_dtype(query)
+
+        cur = self._conn.cursor()
+        cur.execute(
+            f"SELECT {query}, rowid, chunk, frame_idx FROM frames"
+            f" WHERE {query} IS NOT NULL ORDER BY {query}, rowid;"
+        )
+        # filled straight from the cursor, without holding the rows as tuples
+        rows = np.fromiter(
+            cur,
+            dtype=[
+                ("value", value_dtype),
+                ("rowid", np.int64),
+                ("chunk", np.int64),
+                ("frame_idx", np.int64),
+            ],
+        )
+        sorted_frames = tuple(
+            np.ascontiguousarray(rows[name]) for name in rows.dtype.names
+        )
+
+        self._sorted_frames[query] = sorted_frames
+        return sorted_frames
 
     def find_chunk(self, what, value):
         assert what in ("frame_number", "frame_time", "index")
@@ -364,50 +636,62 @@ class ImgStoreIndex(object):
 
         return chunk_n, frame_idx
 
-    def find_chunk_nearest(self, query, value, target = "chunk, frame_idx", direction="all"):
-        assert query in ("frame_number", "frame_time")
-        cur = self._conn.cursor()
-        
-        if direction=="all":
-            cmd = (
-                f"SELECT {target}"
-                " FROM frames ORDER BY ABS(? - {}) LIMIT 1;".format(
-                    query
-                ),
-                (value,)
-            )
-        
-        elif direction=="future":
-            cmd = (
-                f"SELECT {target}"
-                " FROM frames"
-                " WHERE (? - {}) <= 0"
-                " ORDER BY ABS(? - {})"
-                " LIMIT 1;".format(query, query),
-                (value, value,)
-
-            )
-        
-        elif direction=="past":
-            cmd = (
-                f"SELECT {target}"
-                " FROM frames"
-                " WHERE (? - {}) >= 0"
-                " ORDER BY ABS(? - {})"
-                " LIMIT 1;".format(query, query),
-                (value, value,)
-
-            )
+    def _find_nearest_sorted(self, query, value, direction):
+        values, rowids, chunks, frame_idxs = self._get_sorted_frames(query)
+        if direction == "past":
+            i = np.searchsorted(values, value, side="right") - 1
+            if i < 0:
+                return None
+            # the first of the frames with that value
+            i = np.searchsorted(values, values[i], side="left")
+        else:
+            i = np.searchsorted(values, value, side="left")
+            if i == len(values):
+                return None
+        return int(chunks[i]), int(frame_idxs[i]), values[i].item(), int(rowids[i])
+
+    def _find_nearest_row(self, query, value, target, direction):
+        if target == "chunk, frame_idx":
+            return self._find_nearest_sorted(query, value, direction)
+
+        # the closest value on one side of value is found with the index on
+        # the query column. of several rows with that value, return the first
+        if direction == "past":
+            closest = f"SELECT MAX({query}) FROM frames WHERE {query} <= ?"
+        else:
+            closest = f"SELECT MIN({query}) FROM frames WHERE {query} >= ?"
 
+        cur = self._conn.cursor()
         cur.execute(
-            *cmd,
+            f"SELECT {target}, {query}, rowid FROM frames"
+            f" WHERE {query} = ({closest})"
+            " ORDER BY rowid LIMIT 1;",
+            (value,),
         )
+        return cur.fetchone()
+
+    def find_chunk_nearest(self, query, value, target = "chunk, frame_idx", direction="all"):
+        assert query in ("frame_number", "frame_time")
+        assert direction in ("all", "future", "past")
 
-        data = cur.fetchone()
+        if direction == "all":
+            rows = [
+                row for row in (
+                    self._find_nearest_row(query, value, target, "past"),
+                    self._find_nearest_row(query, value, target, "future"),
+                )
+                if row is not None
+            ]
+            if not rows:
+                return -1, -1
+            # the closest row, or the first one if both are equally close
+            data = min(rows, key=lambda row: (abs(value - row[-2]), row[-1]))
+        else:
+            data = self._find_nearest_row(query, value, target, direction)
 
         if data is None:
-            return self.find_chunk_nearest(query, value, direction="all")
+            return self.find_chunk_nearest(query, value, target, direction="all")
         else:
-            chunk_n, frame_idx = data
+            chunk_n, frame_idx = data[:-2]
 
         return chunk_n, frame_idx
@@ -48,7 +48,7 @@ from .util import (
     motif_extra_data_json_to_df,
     motif_extra_data_h5_attrs,
 )
-from .index import ImgStoreIndex
+from .index import ImgStoreIndex, _npy_index_path
 from .export import ImgStoreExport
 
 from .compat import CV2Compat
@@ -478,7 +478,7 @@ class _ImgStore(CV2Compat):
 
     @staticmethod
     def _save_index(path_with_extension, data_dict):
-        _, extension = os.path.splitext(path_with_extension)
+        path_without_extension, extension = os.path.splitext(path_with_extension)
         if extension == ".yaml":
             with open(path_with_extension, "wt") as f:
                 yaml.safe_dump(data_dict, f)
@@ -488,11 +488,29 @@ class _ImgStore(CV2Compat):
                 # noinspection PyTypeChecker
                 np.savez(f, **data_dict)
                 return path_with_extension
+        elif extension == ".npy":
+            # one file per frame metadata key, which can be memory mapped
+            paths = []
+            for k in _ImgStore.FRAME_MD:
+                if k in data_dict:
+                    path = _npy_index_path(path_without_extension, k)
+                    np.save(path, np.asarray(data_dict[k]))
+                    paths.append(path)
+            return paths
         else:
             raise ValueError("unknown index format: %s" % extension)
 
     @staticmethod
     def _remove_index(path_without_extension):
+        removed = []
+        for k in _ImgStore.FRAME_MD:
+            path = _npy_index_path(path_without_extension, k)
+            if os.path.exists(path):
+                os.unlink(path)
+                removed.append(path)
+        if removed:
+            return removed
+
         for extension in (".npz", ".yaml"):
             path = path_without_extension + extension
             if os.path.exists(path):
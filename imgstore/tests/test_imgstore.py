@@ -910,6 +910,23 @@ def _non_monotonic_store_with_wrap(fmt, basedir, chunksize, save_index):
     return s.full_path, times
 
 
+def _write_npz_chunks(tmpdir, chunks):
+    """
+    Write a .npz chunk index in tmpdir for each (frame_number, frame_time)
+    in chunks, and return their chunk_n_and_chunk_paths
+    """
+    chunk_n_and_chunk_paths = []
+    for chunk_n, (frame_number, frame_time) in enumerate(chunks):
+        path = tmpdir.join("%06d" % chunk_n).strpath
+        np.savez(
+            path + ".npz",
+            frame_number=np.asarray(frame_number),
+            frame_time=np.asarray(frame_time),
+        )
+        chunk_n_and_chunk_paths.append((chunk_n, path))
+    return chunk_n_and_chunk_paths
+
+
 @pytest.mark.parametrize("chunksize", (2, 100))
 @pytest.mark.parametrize("fmt", ["npy", "mjpeg"])
 def test_complex_framenumber(tmpdir, chunksize, fmt):
@@ -1046,6 +1063,289 @@ def test_index(tmpdir, chunksize):
     assert f._chunk_n_and_chunk_paths is not None
 
 
+@pytest.mark.parametrize("savez", (np.savez, np.savez_compressed))
+def test_read_npz(tmpdir, savez):
+    from imgstore.index import _read_npz
+
+    path = tmpdir.join("000000.npz").strpath
+    savez(
+        path,
+        frame_number=np.arange(10, 20),
+        frame_time=np.linspace(0.0, 1.0, 10),
+        frame_in_chunk=np.array([0, None], dtype=object),
+        fortran=np.asfortranarray(np.arange(12.0).reshape(3, 4)),
+        scalar=np.array(42),
+    )
+
+    keys = ("frame_number", "frame_time", "frame_in_chunk", "fortran", "scalar", "missing")
+    data = _read_npz(path, keys)
+    assert "missing" not in data
+
+    with np.load(path, allow_pickle=True) as dat:
+        assert sorted(data) == sorted(dat.files)
+        for k in dat.files:
+            assert data[k].dtype == dat[k].dtype
+            npt.assert_array_equal(data[k], dat[k])
+
+
+def test_read_npz_bad_crc(tmpdir):
+    from imgstore.index import _read_npz
+
+    path = tmpdir.join("000000.npz").strpath
+    frame_number = np.arange(10, 20)
+    np.savez(path, frame_number=frame_number)
+
+    # flip a bit in the stored frame_number data
+    with open(path, "rb") as f:
+        buf = bytearray(f.read())
+    pos = buf.index(frame_number.tobytes())
+    buf[pos] ^= 0x10
+    with open(path, "wb") as f:
+        f.write(buf)
+
+    with pytest.raises(IOError):
+        _read_npz(path, ("frame_number",))
+
+
+@pytest.mark.parametrize(
+    "content", (b"", b"not a zip file"), ids=["empty", "garbage"]
+)
+def test_read_npz_corrupt(tmpdir, content):
+    from imgstore.index import _read_npz
+
+    path = tmpdir.join("000000.npz").strpath
+    with open(path, "wb") as f:
+        f.write(content)
+    with pytest.raises(IOError):
+        _read_npz(path, ("frame_number", "frame_time"))
+
+
+def test_npy_index(tmpdir):
+    from imgstore.index import _load_index, ImgStoreIndex
+
+    md = {
+        "frame_number": list(range(10, 20)),
+        "frame_time": list(np.linspace(0.0, 1.0, 10)),
+        "frame_in_chunk": list(range(10)),
+    }
+    path = tmpdir.join("000000").strpath
+    written = stores._ImgStore._save_index(path + ".npy", md)
+    assert written == [
+        path + "_frame_number.npy",
+        path + "_frame_time.npy",
+        path + "_frame_in_chunk.npy",
+    ]
+    assert all(os.path.exists(p) for p in written)
+    assert not os.path.exists(path + ".npz")
+
+    idx = _load_index(path)
+    assert sorted(idx) == ["frame_number", "frame_time"]
+    for k in idx:
+        assert isinstance(idx[k], np.memmap)
+        npt.assert_array_equal(idx[k], md[k])
+
+    index = ImgStoreIndex.new_from_chunks([(0, path)])
+    assert index.frame_count == 10
+    assert (index.frame_min, index.frame_max) == (10, 19)
+    npt.assert_array_equal(
+        index.get_chunk_metadata(0)["frame_number"], md["frame_number"]
+    )
+
+    assert stores._ImgStore._remove_index(path) == written
+    with pytest.raises(IOError):
+        _load_index(path)
+
+
+def test_index_sorted_lookups(tmpdir):
+    from imgstore.index import ImgStoreIndex
+
+    # non monotonic, with repeated frame numbers and times
+    r = np.random.RandomState(42)
+    chunk_n_and_chunk_paths = _write_npz_chunks(
+        tmpdir,
+        [(r.randint(0, 30, 50), r.randint(0, 60, 50) * 0.5) for _ in range(4)],
+    )
+    idx = ImgStoreIndex.new_from_chunks(chunk_n_and_chunk_paths)
+
+    for query in ("frame_number", "frame_time"):
+        for value in np.arange(-3, 65, 0.25).tolist():
+            for direction in ("all", "past", "future"):
+                # any other target is answered by sqlite
+                assert idx.find_chunk_nearest(
+                    query, value, direction=direction
+                ) == idx.find_chunk_nearest(
+                    query, value, target="chunk,frame_idx", direction=direction
+                )
+
+            cur = idx._conn.execute(
+                f"SELECT chunk, frame_idx FROM frames WHERE {query} = ?"
+                " ORDER BY rowid LIMIT 1;",
+                (value,),
+            )
+            assert idx.get_chunk_and_frame_idx_(value, query) == cur.fetchone()
+
+    # frame times are cached and prefetched, in any order of access
+    for frame_number in list(range(30)) + list(range(29, -1, -3)):
+        cur = idx._conn.execute(
+            "SELECT frame_time FROM frames WHERE frame_number = ?"
+            " ORDER BY rowid LIMIT 1;",
+            (frame_number,),
+        )
+        row = cur.fetchone()
+        if row is None:
+            with pytest.raises(IndexError):
+                idx.get_frame_time(frame_number=frame_number)
+        else:
+            assert idx.get_frame_time(frame_number=frame_number) == row[0]
+
+
+def test_index_metadata_types(tmpdir):
+    import json
+    import yaml
+    import pandas as pd
+    from imgstore.index import ImgStoreIndex
+
+    frame_numbers = [[0.0, 1.5, 2.0], [3, 4, 5]]
+    frame_times = [[0.0, 0.1, 0.2], [0.3, 0.4, 0.5]]
+    chunk_n_and_chunk_paths = _write_npz_chunks(
+        tmpdir, zip(frame_numbers, frame_times)
+    )
+    idx = ImgStoreIndex.new_from_chunks(chunk_n_and_chunk_paths)
+
+    # every column of every chunk is a list, whatever its values
+    for chunk_n in range(2):
+        md = idx.get_chunk_metadata(chunk_n)
+        assert md == {
+            "frame_number": frame_numbers[chunk_n],
+            "frame_time": frame_times[chunk_n],
+        }
+        assert all(type(v) is list for v in md.values())
+    assert idx.get_chunk_metadata(42) == {"frame_number": [], "frame_time": []}
+
+    md = idx.get_all_metadata()
+    assert all(type(v) is list for v in md.values())
+    assert md["frame_number"] + [6] == [0, 1.5, 2, 3, 4, 5, 6]
+    assert json.loads(json.dumps(md)) == md
+    assert yaml.safe_load(yaml.safe_dump(md)) == md
+
+    # as used by MultiStore crossindex and ImgStoreExport
+    df = pd.DataFrame(
+        {"main_number": md["frame_number"], "frame_time": md["frame_time"]}
+    )
+    assert df["frame_time"].tolist() == md["frame_time"]
+    df = pd.DataFrame(idx.get_chunk_metadata(1))
+    assert df.loc[df["frame_time"] == 0.4]["frame_number"].values[0] == 4
+
+
+def test_index_to_file_open(tmpdir):
+    import sqlite3
+    from imgstore.index import ImgStoreIndex
+
+    chunk_n_and_chunk_paths = _write_npz_chunks(
+        tmpdir,
+        [
+            (np.arange(10), np.linspace(0.0, 0.9, 10)),
+            (np.arange(10, 20), np.linspace(1.0, 1.9, 10)),
+        ],
+    )
+
+    path = tmpdir.join(".index.sqlite").strpath
+    ImgStoreIndex.new_from_chunks(chunk_n_and_chunk_paths[:1]).to_file(path)
+
+    # saving an index to the file it was opened from leaves the file as is
+    opened = ImgStoreIndex.new_from_file(path)
+    opened.to_file(path)
+    assert ImgStoreIndex.new_from_file(path).frame_count == 10
+
+    # another connection in a read transaction does not block saving
+    reader = sqlite3.connect(path)
+    reader.execute("BEGIN;")
+    assert reader.execute("SELECT COUNT(1) FROM frames;").fetchone() == (10,)
+
+    ImgStoreIndex.new_from_chunks(chunk_n_and_chunk_paths).to_file(path)
+    assert ImgStoreIndex.new_from_file(path).frame_count == 20
+    assert opened.frame_count == 10
+    assert reader.execute("SELECT COUNT(1) FROM frames;").fetchone() == (10,)
+    reader.close()
+    assert not [p for p in tmpdir.listdir() if p.ext == ".tmp"]
+
+
+def test_chunk_index_cache(tmpdir, monkeypatch):
+    import hashlib
+    from imgstore.index import ImgStoreIndex
+
+    chunks = [
+        (np.arange(n * 10, n * 10 + 10), np.linspace(n, n + 0.9, 10))
+        for n in range(3)
+    ]
+    # frame numbers that are not integers are not truncated in the cache
+    chunks.append(([30.5, 31.5], [3.0, 3.1]))
+    chunk_n_and_chunk_paths = _write_npz_chunks(tmpdir, chunks)
+
+    idx = ImgStoreIndex.new_from_chunks(chunk_n_and_chunk_paths)
+    chunk_index = idx.chunk_index
+    assert chunk_index["frame_number"] == {
+        0: (0, 9),
+        1: (10, 19),
+        2: (20, 29),
+        3: (30.5, 31.5),
+    }
+    assert chunk_index["frame_time"][2] == (2.0, 2.9)
+    assert len(tmpdir.join("cache").listdir()) == 1
+
+    # loaded from the cache, without querying the database
+    cached = ImgStoreIndex.new_from_chunks(chunk_n_and_chunk_paths)
+    cached._conn.close()
+    assert cached.chunk_index == chunk_index
+
+    # the chunk list is only hashed on first access
+    monkeypatch.setattr(hashlib, "md5", None)
+    assert idx.chunk_index is chunk_index
+    assert cached.chunk_index == chunk_index
+
+
+def test_index_large_chunk(tmpdir):
+    from imgstore.index import ImgStoreIndex
+
+    # two full INSERT batches and a partial one
+    n = 2 * ImgStoreIndex.INSERT_BATCH_SIZE + 50
+    r = np.random.RandomState(42)
+    frame_number = r.randint(0, 1000, n)
+    frame_time = r.uniform(0.0, 100.0, n)
+    chunk_n_and_chunk_paths = _write_npz_chunks(tmpdir, [(frame_number, frame_time)])
+
+    idx = ImgStoreIndex.new_from_chunks(chunk_n_and_chunk_paths)
+    assert idx.frame_count == n
+    assert idx.get_chunk_metadata(0) == {
+        "frame_number": frame_number.tolist(),
+        "frame_time": frame_time.tolist(),
+    }
+    cur = idx._conn.execute("SELECT chunk, frame_idx FROM frames ORDER BY rowid;")
+    assert cur.fetchall() == [(0, i) for i in range(n)]
+
+
+def test_empty_index(tmpdir):
+    from imgstore.index import ImgStoreIndex
+
+    chunk_n_and_chunk_paths = _write_npz_chunks(
+        tmpdir, [(np.array([], dtype=np.int64), np.array([], dtype=np.float64))]
+    )
+
+    # the summary aggregates over no frames are NULL
+    idx = ImgStoreIndex.new_from_chunks(chunk_n_and_chunk_paths)
+    assert idx.frame_count == 0
+    assert idx.chunks == ()
+    assert np.isnan(idx.frame_min) and np.isnan(idx.frame_max)
+    assert (idx.frame_time_min, idx.frame_time_max) == (0.0, 0.0)
+    assert idx.get_all_metadata() == {"frame_number": [], "frame_time": []}
+
+    empty = {"frame_number": {}, "frame_time": {}}
+    assert idx.chunk_index == empty
+    cached = ImgStoreIndex.new_from_chunks(chunk_n_and_chunk_paths)
+    cached._conn.close()
+    assert cached.chunk_index == empty
+
+
 @pytest.mark.parametrize("fmt", ["npy", "mjpeg", "avc1/mp4", "h264/mkv"])
 @pytest.mark.parametrize("nframes", [2, 3, 4])
 @pytest.mark.parametrize("seek", [True, False], ids=["seek", "noseek"])